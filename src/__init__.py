@@ -2,23 +2,34 @@
 
 import argparse
 import asyncio
-import json
 import logging
+import os
+import pickle
 import signal
 import sys
-from collections.abc import Callable
+import tempfile
 from pathlib import Path
 
 import aiomqtt
 import yaml
 
 from _version import __version__
-from errors import ClientConnectionError, ClientTimeoutError
-from models import Config, Subscription, TesiraConfig
-from mqtt_connection import AVAILABILITY_TOPIC, MqttConnection
+from errors import ClientConnectionError, ClientError, ClientTimeoutError
+from models import Config, Subscription
+from mqtt_connection import STATUS_PAYLOADS, MqttConnection, availability_topic
 from tesira import BiampTesiraConnection
 from utils.arguments import EnvDefault
 
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -47,23 +58,92 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def _cache_key(source: os.stat_result) -> tuple:
+    """Return the key a cached config must match to be reused."""
+    # The pickle depends on both the config file and the models that define it
+    models = Path(sys.modules[Config.__module__].__file__).stat()
+    return (
+        __version__,
+        models.st_mtime_ns,
+        models.st_size,
+        source.st_mtime_ns,
+        source.st_size,
+    )
+
+
+def _load_cached_config(cache_path: Path, key: tuple) -> Config | None:
+    """Load a previously pickled config if it still matches the source file."""
+    # The key is pickled on its own ahead of the config, so that a cache written by
+    # an older build is rejected before its models are unpickled
+    try:
+        with cache_path.open("rb") as f:
+            if pickle.load(f) != key:  # noqa: S301
+                return None
+            config = pickle.load(f)  # noqa: S301
+    except FileNotFoundError:
+        return None
+    except Exception:  # noqa: BLE001
+        # Caching is best effort, any unreadable cache is rebuilt from the source
+        _LOGGER.debug("Ignoring unreadable config cache %s", cache_path)
+        return None
+    if not isinstance(config, Config):
+        return None
+    return config
+
+
+def _write_cached_config(cache_path: Path, key: tuple, config: Config) -> None:
+    """Atomically pickle the config next to the source file."""
+    data = pickle.dumps(key, protocol=5) + pickle.dumps(config, protocol=5)
+    try:
+        fd, tmp_name = tempfile.mkstemp(
+            dir=cache_path.parent, prefix=f".{cache_path.name}."
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            Path(tmp_name).replace(cache_path)
+        except OSError:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+    except OSError:
+        # The config directory may be mounted read-only, caching is best effort
+        _LOGGER.debug("Unable to write config cache %s", cache_path)
+
+
 def load_config(config_file: str) -> Config:
     """Load the configuration file to a dictionary."""
     config_path = Path(config_file)
     if not config_path.exists() and not config_path.is_file():
         sys.exit(f"Config file: {config_file} does not exist")
-    with Path(config_path).open() as f:
-        return Config(**yaml.safe_load(f))
+
+    key = _cache_key(config_path.stat())
+    cache_path = config_path.with_suffix(config_path.suffix + ".pkl")
+    config = _load_cached_config(cache_path, key)
+    if config is not None:
+        _LOGGER.debug("Loaded config from cache %s", cache_path)
+        return config
+
+    if YamlLoader is yaml.SafeLoader:
+        _LOGGER.warning(
+            "libyaml is not available, falling back to the pure Python YAML loader"
+        )
+    config = Config(**yaml.load(config_path.read_bytes(), Loader=YamlLoader))
+    _write_cached_config(cache_path, key, config)
+    return config
 
 
 async def establish_tesira_connection(
-    tesira: TesiraConfig, subscriptions: set[Subscription], mqtt: MqttConnection
-) -> BiampTesiraConnection:
+    connection: BiampTesiraConnection,
+    subscriptions: set[Subscription],
+    tg: asyncio.TaskGroup,
+    tasks: list[asyncio.Task],
+) -> None:
     """Establish a connection to the Tesira device and create all subscriptions."""
-    connection = BiampTesiraConnection(tesira, mqtt)
     await connection.open()
+    # The reader hands the subscribe replies over, so it has to run first
+    tasks.append(tg.create_task(connection.listen_to_incoming_messages()))
+    tasks.append(tg.create_task(connection.publish_queued_states()))
     await connection.subscribe_all(subscriptions)
-    return connection
 
 
 async def handle_exit(
@@ -99,18 +179,27 @@ async def handle_exit(
 
 
 async def listen_to_incoming_mqtt_messages(
-    barrier: asyncio.Barrier,
+    startup_ready: asyncio.Event,
     mqtt_client: aiomqtt.Client,
     tesira_connection: BiampTesiraConnection,
+    base_topic: str,
 ) -> None:
     """Infinitely process incoming MQTT messages."""
     _LOGGER.info("Starting MQTT subscription reading loop")
-    await barrier.wait()
+    # Command topics are {base_topic}/{key}/set, slice the key out directly
+    prefix_len = len(base_topic) + 1
+    await startup_ready.wait()
     async for message in mqtt_client.messages:
-        decoded_payload: str = message.payload.decode("utf-8")  # type: ignore  # noqa: PGH003
-        _LOGGER.debug("%s - Received MQTT message: %s", message.topic, decoded_payload)
-        key = message.topic.value.split("/")[1]
-        await tesira_connection.update_state_and_command(key, decoded_payload)
+        payload: bytes = message.payload  # type: ignore  # noqa: PGH003
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("%s - Received MQTT message: %s", message.topic, payload)
+        topic = message.topic.value
+        key = topic[prefix_len : topic.index("/", prefix_len)]
+        # A bad payload or a Tesira that does not answer only fails this message
+        try:
+            await tesira_connection.update_state_and_command(key, payload)
+        except ClientError as error:
+            _LOGGER.warning("Failed to handle MQTT message on %s: %s", topic, error)
 
 
 async def async_main() -> None:
@@ -122,37 +211,44 @@ async def async_main() -> None:
         password=config.mqtt.password,
         keepalive=config.mqtt.keepalive,
         will=aiomqtt.Will(
-            topic=AVAILABILITY_TOPIC.format(config.mqtt.base_topic),
-            payload=json.dumps({"state": "offline"}),
+            topic=availability_topic(config.mqtt.base_topic),
+            payload=STATUS_PAYLOADS["offline"],
             retain=True,
         ),
     )
 
     async with mqtt_client:  # noqa: SIM117
         async with asyncio.TaskGroup() as tg:
-            mqtt_connection = MqttConnection(mqtt_client, config.mqtt.base_topic)
+            mqtt_connection = MqttConnection(
+                mqtt_client,
+                config.mqtt.base_topic,
+                config.mqtt.qos,
+                config.mqtt.attributes_qos,
+            )
+            tesira_connection = BiampTesiraConnection(config.tesira, mqtt_connection)
+            tasks: list[asyncio.Task] = []
             try:
-                tesira_connection = await establish_tesira_connection(
-                    config.tesira, config.subscriptions, mqtt_connection
+                await establish_tesira_connection(
+                    tesira_connection, config.subscriptions, tg, tasks
                 )
             except (ClientConnectionError, ClientTimeoutError):
                 _LOGGER.exception("Failed to establish Tesira connection")
                 # Clean up: publish offline status and exit gracefully
-                await handle_exit(mqtt_connection, None, None)
+                await handle_exit(mqtt_connection, tesira_connection, tasks)
                 # Allow time for message delivery before exiting
                 await asyncio.sleep(0.5)
                 sys.exit(1)
 
-            barrier = asyncio.Barrier(4)
-            tasks = []
-            tasks.append(
-                tg.create_task(tesira_connection.listen_to_incoming_messages(barrier))
-            )
-
+            # Set once, after open(), the initial subscribe_all and the online status.
+            # The Tesira reader is already running, it hands over the subscribe replies
+            startup_ready = asyncio.Event()
             tasks.append(
                 tg.create_task(
                     listen_to_incoming_mqtt_messages(
-                        barrier, mqtt_client, tesira_connection
+                        startup_ready,
+                        mqtt_client,
+                        tesira_connection,
+                        config.mqtt.base_topic,
                     )
                 )
             )
@@ -160,45 +256,28 @@ async def async_main() -> None:
             tasks.append(
                 tg.create_task(
                     tesira_connection.automatically_subscribe_on_schedule(
-                        barrier, config.subscriptions
+                        startup_ready, config.subscriptions
                     )
                 )
             )
 
-            # Create signal handlers with proper variable capture
-            def create_signal_handler(
-                mqtt: MqttConnection,
-                tesira: BiampTesiraConnection,
-                tasks: list[asyncio.Task],
-            ) -> Callable[[], None]:
-                """Create a signal handler that captures variables by value."""
-
-                async def signal_handler() -> None:
-                    """Handle signal by gracefully shutting down the application."""
-                    try:
-                        await handle_exit(mqtt, tesira, tasks)
-                    except Exception:
-                        _LOGGER.exception("Error during graceful shutdown")
-                        # Force exit if graceful shutdown fails
-                        sys.exit(1)
-
-                return signal_handler
-
-            for signame in ("SIGINT", "SIGTERM"):
-                handler = create_signal_handler(
-                    mqtt_connection, tesira_connection, tasks
-                )
-                asyncio.get_running_loop().add_signal_handler(
-                    getattr(signal, signame), lambda h=handler: asyncio.create_task(h())
-                )
+            loop = asyncio.get_running_loop()
+            stop = asyncio.Event()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
 
             # Publish online status after all tasks are created and ready
             await mqtt_connection.publish_status()
-            await barrier.wait()
+            startup_ready.set()
             _LOGGER.info("Tesira2MQTT is ready")
 
-    for signame in ("SIGINT", "SIGTERM"):
-        asyncio.get_running_loop().remove_signal_handler(getattr(signal, signame))
+            await stop.wait()
+            try:
+                await handle_exit(mqtt_connection, tesira_connection, tasks)
+            except Exception:
+                _LOGGER.exception("Error during graceful shutdown")
+                # Force exit if graceful shutdown fails
+                sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -210,4 +289,4 @@ if __name__ == "__main__":
     )
     _LOGGER.info("Tesira2MQTT version %s", __version__)
     config = load_config(args.config)
-    asyncio.run(async_main())
+    asyncio.run(async_main(), loop_factory=uvloop.new_event_loop if uvloop else None)
@@ -1,8 +1,10 @@
 """Datamodels used by Tesira2MQTT."""
 
-from typing import Literal
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+from typing import Any, Literal, Self
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 
 
 class MqttConfig(BaseModel):
@@ -14,6 +16,8 @@ class MqttConfig(BaseModel):
     user: str
     password: str
     keepalive: int
+    qos: Literal[0, 1, 2] = 1
+    attributes_qos: Literal[0, 1, 2] = 0
 
 
 class TesiraConfig(BaseModel):
@@ -27,32 +31,96 @@ class TesiraConfig(BaseModel):
 class Subscription(BaseModel):
     """A datamodel representing the subscription config in config.yaml."""
 
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     instance_tag: str
     attribute: Literal["mute", "level"]
     index: int
     name: str
     device_name: str
 
-    def __key(self) -> tuple:
-        return (
+    _key: tuple = PrivateAttr()
+    _hash: int = PrivateAttr()
+    _identifier: str = PrivateAttr()
+
+    def model_post_init(self, _context: Any, /) -> None:
+        """Compute the hashkey and identifier once, the model is frozen."""
+        self._identifier = f"{self.instance_tag}_{self.attribute}_{self.index}"
+        self._key = (
             self.instance_tag,
             self.attribute,
             self.index,
             self.name,
             self.device_name,
         )
+        self._hash = hash(self._key)
+
+    def model_copy(
+        self, *, update: Mapping[str, Any] | None = None, deep: bool = False
+    ) -> Self:
+        """Copy the model, recomputing the hashkey and identifier of the copy."""
+        copied = super().model_copy(update=update, deep=deep)
+        copied.model_post_init(None)
+        return copied
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Restore a pickled subscription, recomputing the per-process hash."""
+        super().__setstate__(state)
+        self.model_post_init(None)
+
+    @property
+    def identifier(self) -> str:
+        """Return the key used to route Tesira and MQTT messages."""
+        return self._identifier
 
     def __hash__(self) -> int:
         """Return the hashkey of this object."""
-        return hash(self.__key())
+        return self._hash
 
     def __eq__(self, other: object) -> bool:
         """Check the equality of this object with another one."""
         if isinstance(other, Subscription):
-            return self.__key() == other.__key()
+            return self._key == other._key
         return NotImplemented
 
 
+@dataclass(slots=True)
+class SubscriptionState:
+    """The state of a subscription that the Tesira confirmed."""
+
+    instance_tag: str
+    attribute: str
+    index: int
+    state: Any
+    variable_type: str
+    device_id: str
+    unique_id: str
+    name: str
+    device_name: str
+    identifier: str
+    min_level: float | None = None
+    max_level: float | None = None
+    # The start of the command that sets the value, e.g. "Level1 set level 1 "
+    cmd_prefix: str = field(init=False, repr=False, compare=False)
+    # Everything but the state is fixed once the subscription exists
+    _template: dict[str, Any] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        """Build the set command prefix and the dict returned by as_dict once."""
+        self.cmd_prefix = f"{self.instance_tag} set {self.attribute} {self.index} "
+        self._template = {
+            item.name: getattr(self, item.name)
+            for item in fields(self)
+            if item.init and getattr(self, item.name) is not None
+        }
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the state as a dict, leaving out levels that do not apply."""
+        data = self._template.copy()
+        data["state"] = self.state
+        return data
+
+
 class Config(BaseModel):
     """A datamodel representing the config in config.yaml."""
 
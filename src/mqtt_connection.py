@@ -1,32 +1,123 @@
 """Maintains connections to the MQTT Server."""
 
+import asyncio
+import functools
 import json
 import logging
+import re
 
 import aiomqtt
 import slugify
 
+try:
+    from orjson import dumps as json_dumps
+except ImportError:
+
+    def json_dumps(obj: object) -> bytes:
+        """Serialize to compact JSON bytes, matching orjson's output."""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
 _LOGGER = logging.getLogger(__name__)
 
-AVAILABILITY_TOPIC = "{0}/availability"
 MANUFACTURER = "Biamp Systems, LLC"
+STATUS_PAYLOADS = {
+    status: json_dumps({"state": status}) for status in ("online", "offline")
+}
+
+# Placeholders in discovery templates, e.g. "__UNIQUE_ID__"
+_TEMPLATE_FIELD = re.compile(rb'"__([A-Z_]+)__"')
+
+
+def availability_topic(base_topic: str) -> str:
+    """Return the availability topic for the given base topic."""
+    return f"{base_topic}/availability"
+
+
+@functools.lru_cache(maxsize=1024)
+def _slug(name: str) -> str:
+    """Return the Home Assistant entity slug of a name."""
+    return slugify.slugify(name, separator="_")
+
+
+def _compile_template(payload: dict) -> list[bytes]:
+    """Serialize a payload once and split it around its placeholders."""
+    return _TEMPLATE_FIELD.split(json_dumps(payload))
+
+
+def _render_template(template: list[bytes], values: dict[bytes, object]) -> bytes:
+    """Fill in the placeholders of a compiled template with JSON values."""
+    parts = template.copy()
+    for i in range(1, len(parts), 2):
+        parts[i] = json_dumps(values[parts[i]])
+    return b"".join(parts)
 
 
 class MqttConnection:
     """MqttConnection used for communication with MQTT."""
 
-    def __init__(self, client: aiomqtt.Client, base_topic: str) -> None:
+    def __init__(
+        self,
+        client: aiomqtt.Client,
+        base_topic: str,
+        qos: int = 1,
+        attributes_qos: int = 0,
+    ) -> None:
         """Initialize an object to manage MQTT communications."""
         self._client = client
         self._base_topic = base_topic
         self._published_names = set()
-        self._qos = 2
+        self._last_published: dict[str, tuple] = {}
+        self._qos = qos
+        self._attributes_qos = attributes_qos
+        self._availability_topic = availability_topic(base_topic)
+
+        # Discovery payloads only differ per entity in a few fields
+        discovery = {
+            "dev": {
+                "ids": "__DEVICE_IDS__",
+                "name": "__DEVICE_NAME__",
+                "mf": MANUFACTURER,
+                "sn": "__SERIAL__",
+            },
+            "origin": {"name": "Tesira2MQTT"},
+            "availability": [
+                {
+                    "topic": self._availability_topic,
+                    "value_template": "{{ value_json.state }}",
+                }
+            ],
+            "name": "__NAME__",
+            "state_topic": "__STATE_TOPIC__",
+            "unique_id": "__UNIQUE_ID__",
+            "value_template": "{{ value_json }}",
+            "command_topic": "__COMMAND_TOPIC__",
+        }
+        self._switch_template = _compile_template(
+            {
+                **discovery,
+                "payload_on": True,
+                "payload_off": False,
+                "default_entity_id": "__DEFAULT_ENTITY_ID__",
+            }
+        )
+        self._number_template = _compile_template(
+            {
+                **discovery,
+                "max": "__MAX__",
+                "min": "__MIN__",
+                "step": 0.1,
+                "unit_of_measurement": "dB",
+                "default_entity_id": "__DEFAULT_ENTITY_ID__",
+            }
+        )
 
     async def publish_status(self, status: str = "online") -> None:
         """Indicate that the server is available."""
+        payload = STATUS_PAYLOADS.get(status) or json_dumps({"state": status})
         await self._client.publish(
-            topic=AVAILABILITY_TOPIC.format(self._base_topic),
-            payload=json.dumps({"state": status}),
+            topic=self._availability_topic,
+            payload=payload,
             retain=True,
             qos=self._qos,
         )
@@ -35,33 +126,67 @@ class MqttConnection:
         """Publish the state of an object."""
         state: str = data["state"]
         identifier: str = data["identifier"]
-        topic_name: str = f"{data['device_name']} {name}"
         topic_state: str = f"{self._base_topic}/{identifier}/state"
-        _LOGGER.debug(
-            "Publishing state %s for %s to %s", state, topic_name, topic_state
-        )
-        await self._client.publish(
-            topic=topic_state, payload=json.dumps(state), retain=True, qos=self._qos
-        )
-
-        topic_attributes = f"{self._base_topic}/{identifier}/attributes"
-        attributes = json.dumps(data)
-        _LOGGER.debug(
-            "Publishing attributes %s for %s to %s",
-            attributes,
-            topic_name,
-            topic_attributes,
-        )
-
-        await self._client.publish(
-            topic=topic_attributes, payload=attributes, retain=True, qos=self._qos
-        )
+        publishes = []
+
+        # The state is part of the attributes, so unchanged attributes mean there
+        # is nothing new to publish (e.g. during resubscription)
+        attributes_key = tuple(data.items())
+        if self._last_published.get(identifier) != attributes_key:
+            _LOGGER.debug(
+                "Publishing state %s for %s %s to %s",
+                state,
+                data["device_name"],
+                name,
+                topic_state,
+            )
+            publishes.append(
+                self._client.publish(
+                    topic=topic_state,
+                    payload=json_dumps(state),
+                    retain=True,
+                    qos=self._qos,
+                )
+            )
 
-        if identifier not in self._published_names:
-            await self.publish_discovery(
-                name, data, serial, topic_state, topic_name, identifier
+            topic_attributes = f"{self._base_topic}/{identifier}/attributes"
+            attributes = json_dumps(data)
+            _LOGGER.debug(
+                "Publishing attributes %s for %s %s to %s",
+                attributes,
+                data["device_name"],
+                name,
+                topic_attributes,
+            )
+            publishes.append(
+                self._client.publish(
+                    topic=topic_attributes,
+                    payload=attributes,
+                    retain=True,
+                    qos=self._attributes_qos,
+                )
             )
+
+        discovery = identifier not in self._published_names
+        if discovery:
+            # Reserved before awaiting, so that a concurrent publish for the same
+            # identifier does not send the discovery message a second time
             self._published_names.add(identifier)
+            topic_name = f"{data['device_name']} {name}"
+            publishes.append(
+                self.publish_discovery(
+                    name, data, serial, topic_state, topic_name, identifier
+                )
+            )
+
+        if publishes:
+            try:
+                await asyncio.gather(*publishes)
+            except BaseException:
+                if discovery:
+                    self._published_names.discard(identifier)
+                raise
+        self._last_published[identifier] = attributes_key
 
     async def publish_discovery(  # noqa: PLR0913
         self,
@@ -74,55 +199,43 @@ class MqttConnection:
     ) -> None:
         """Publish the discovery message for Home Assistant."""
         _LOGGER.info("Publishing discovery info for %s", identifier)
-        ha_type = ""
-        topic_command = f"{self._base_topic}/{identifier}/set"
-        payload = {
-            "dev": {
-                "ids": f"tesira2mqtt_{data['device_id']}",
-                "name": data["device_name"],
-                "mf": MANUFACTURER,
-                "sn": serial,
-            },
-            "origin": {"name": "Tesira2MQTT"},
-            "availability": [
-                {
-                    "topic": AVAILABILITY_TOPIC.format(self._base_topic),
-                    "value_template": "{{ value_json.state }}",
-                }
-            ],
-            "name": name,
-            "state_topic": topic_state,
-            "unique_id": data["unique_id"],
-            "value_template": "{{ value_json }}",
-            "command_topic": topic_command,
-        }
-
         match data["variable_type"]:
             case "bool":
                 ha_type = "switch"
-                payload["payload_on"] = True
-                payload["payload_off"] = False
+                template = self._switch_template
             case "float":
                 ha_type = "number"
-                payload.update(
-                    {
-                        "max": data["max_level"],
-                        "min": data["min_level"],
-                        "step": 0.1,
-                        "unit_of_measurement": "dB",
-                    }
-                )
+                template = self._number_template
             case _:
                 # We only support mute / levels currently
                 return
 
-        slug = slugify.slugify(topic_name, separator="_")
-        payload["default_entity_id"] = f"{ha_type}.{slug}"
-
-        await self._client.subscribe(topic_command)
+        topic_command = f"{self._base_topic}/{identifier}/set"
+        slug = _slug(topic_name)
+        payload = _render_template(
+            template,
+            {
+                b"DEVICE_IDS": f"tesira2mqtt_{data['device_id']}",
+                b"DEVICE_NAME": data["device_name"],
+                b"SERIAL": serial,
+                b"NAME": name,
+                b"STATE_TOPIC": topic_state,
+                b"UNIQUE_ID": data["unique_id"],
+                b"COMMAND_TOPIC": topic_command,
+                b"MAX": data.get("max_level"),
+                b"MIN": data.get("min_level"),
+                b"DEFAULT_ENTITY_ID": f"{ha_type}.{slug}",
+            },
+        )
 
         topic_config = f"homeassistant/{ha_type}/{data['unique_id']}/config"
-        await self._client.publish(
-            topic=topic_config, payload=json.dumps(payload), retain=True, qos=self._qos
+        await asyncio.gather(
+            self._client.subscribe(topic_command),
+            self._client.publish(
+                topic=topic_config,
+                payload=payload,
+                retain=True,
+                qos=self._qos,
+            ),
         )
         _LOGGER.debug("Published discovery info for %s to %s", identifier, topic_config)
@@ -4,12 +4,15 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 
 from errors import ClientConnectionError, ClientTimeoutError
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
     from telnetlib3.stream_reader import TelnetReader
     from telnetlib3.stream_writer import TelnetWriter
 
@@ -23,6 +26,8 @@ class BiampTesiraTelnetConnection:
     reader: TelnetReader | None
     writer: TelnetWriter | None
     identifier: str
+    # time.monotonic() of the last successful read or write
+    last_activity: float = field(default_factory=time.monotonic)
 
     def close(self) -> None:
         """Close the connection."""
@@ -53,10 +58,35 @@ class BiampTesiraTelnetConnection:
 
         # Send the request
         try:
-            self.writer.write(command + "\r\n")
+            self.writer.write(f"{command}\r\n")
             await self.writer.drain()
         except OSError as err:
             raise ClientConnectionError from err
+        self.last_activity = time.monotonic()
+
+    async def write_many(self, commands: Iterable[str]) -> None:
+        """
+        Send several commands with a single write and drain.
+
+        Args:
+            commands: The commands to send, in order.
+
+        Returns:
+            None
+
+        """
+        # Make sure we're connected
+        if self.writer is None or self.writer.is_closing():
+            msg = "Client not connected."
+            raise ClientConnectionError(msg)
+
+        # Send the requests
+        try:
+            self.writer.write("".join(f"{command}\r\n" for command in commands))
+            await self.writer.drain()
+        except OSError as err:
+            raise ClientConnectionError from err
+        self.last_activity = time.monotonic()
 
     async def readuntil(self, separator: str, timeout_time: float | None = None) -> str:
         """
@@ -77,25 +107,27 @@ class BiampTesiraTelnetConnection:
 
         # Read the response, with optional timeout
         try:
-            data = await asyncio.wait_for(
-                self.reader.readuntil(separator.encode("utf-8")), timeout_time
-            )
+            async with asyncio.timeout(timeout_time):
+                data = await self.reader.readuntil(separator.encode("utf-8"))
         except TimeoutError as err:
             raise ClientTimeoutError from err
         except (OSError, asyncio.IncompleteReadError) as err:
             raise ClientConnectionError from err
 
-        return data.replace(b"\x00", b"").decode("utf-8")
+        self.last_activity = time.monotonic()
+        if b"\x00" in data:
+            data = data.replace(b"\x00", b"")
+        return data.decode("utf-8")
 
-    async def readline(self, timeout_time: float | None = None) -> str:
+    async def read_frame(self, timeout_time: float | None = None) -> str:
         """
-        Read one line or the optional timeout is reached.
+        Read the next non-empty line, skipping the blank lines between responses.
 
         Args:
             timeout_time: The optional timeout in seconds.
 
         Returns:
-            The data read, as a string.
+            The line read, as a string.
 
         """
         # Make sure we're connected
@@ -103,14 +135,51 @@ class BiampTesiraTelnetConnection:
             msg = "Client not connected."
             raise ClientConnectionError(msg)
 
-        # Read the response, with optional timeout
+        # Blank lines are skipped within the timeout, a timeout raises
         try:
-            data = await asyncio.wait_for(self.reader.readline(), timeout_time)
-            cleaned_data = data.replace("\x00", "").strip()  # type: ignore  # noqa: PGH003
-            _LOGGER.debug("%s - Received %s", self.identifier, cleaned_data)
-        except TimeoutError:
-            return ""
+            async with asyncio.timeout(timeout_time):
+                while True:
+                    data = await self.reader.readline()
+                    if not data:
+                        msg = "Connection closed by the Tesira."
+                        raise ClientConnectionError(msg)
+                    if "\x00" in data:
+                        data = data.replace("\x00", "")  # type: ignore  # noqa: PGH003
+                    data = data.strip()  # type: ignore  # noqa: PGH003
+                    if data:
+                        break
+        except TimeoutError as err:
+            raise ClientTimeoutError from err
         except (OSError, asyncio.IncompleteReadError) as err:
             raise ClientConnectionError from err
-        else:
-            return cleaned_data
+
+        self.last_activity = time.monotonic()
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("%s - Received %s", self.identifier, data)
+        return data
+
+    async def read_response(
+        self, command: str, timeout_time: float | None = None
+    ) -> str:
+        """
+        Read the response to a command that was just sent.
+
+        Args:
+            command: The command that was sent, echoed back by some devices.
+            timeout_time: The optional timeout in seconds.
+
+        Returns:
+            The first +OK, -ERR or ! line, as a string.
+
+        """
+        # The response is complete as soon as a line with one of these prefixes
+        # arrives, skip the echo of the command and the blank lines around it
+        try:
+            async with asyncio.timeout(timeout_time):
+                while True:
+                    data = await self.read_frame()
+                    if data != command and data.startswith(("+", "-", "!")):
+                        return data
+        except TimeoutError as err:
+            msg = f"Timeout waiting for the response to {command}"
+            raise ClientTimeoutError(msg) from err
@@ -2,6 +2,11 @@
 
 import asyncio
 import logging
+import re
+import sys
+import time
+from collections import deque
+from collections.abc import Callable
 
 import telnetlib3
 from pydantic import TypeAdapter
@@ -12,12 +17,31 @@ from errors import (
     ClientResponseError,
     ClientTimeoutError,
 )
-from models import Subscription, TesiraConfig
+from models import Subscription, SubscriptionState, TesiraConfig
 from mqtt_connection import MqttConnection
 from telnet import BiampTesiraTelnetConnection
 
 _LOGGER = logging.getLogger(__name__)
 
+_BOOL_PAYLOADS = {b"true": "true", b"false": "false"}
+# ! "publishToken":"<key>" "value":<value>
+_PUBLISH_RE = re.compile(r'^! "publishToken":"([^"]+)" "value":(.+)')
+# +OK "value":<value>, with the quotes around string values dropped
+_VALUE_RE = re.compile(r'"value":"?([^"]*)"?')
+
+# Building a TypeAdapter compiles a schema, so build one per variable type up front
+_ADAPTERS: dict[str, TypeAdapter] = {
+    "bool": TypeAdapter(bool),
+    "float": TypeAdapter(float),
+    "str": TypeAdapter(str),
+}
+# Plain converters for the values the Tesira publishes, used on the read loop
+_CONVERTERS: dict[str, Callable[[str], bool | float | str]] = {
+    "bool": lambda value: value.lower() == "true",
+    "float": float,
+    "str": str,
+}
+
 
 class BiampTesiraConnection:
     """BiampTesiraConnection used for communication with Biamp Tesira DSPs."""
@@ -27,32 +51,39 @@ class BiampTesiraConnection:
         self._tesira: TesiraConfig = tesira
         self._mqtt: MqttConnection = mqtt
         self._timeout: int = 10
-        self._semaphore = asyncio.Semaphore(1)
+        # Serializes request/response pairs on the command telnet
+        self._command_lock = asyncio.Lock()
+        self._keep_alive_task: asyncio.Task[None] | None = None
         self._subscription_telnet: BiampTesiraTelnetConnection | None = None
         self._command_telnet: BiampTesiraTelnetConnection | None = None
         self._serial_number: str | None = None
-        self._subscriptions: dict = {}
+        self._subscriptions: dict[str, SubscriptionState] = {}
+        # Replies to commands sent on the subscription telnet, in the order the
+        # commands were sent. Only the reader loop reads that telnet and resolves them
+        self._pending: deque[asyncio.Future[str]] = deque()
+        self._initial_values: dict[str, str] = {}
+        # Identifiers whose state changed and still has to be published. An
+        # identifier is queued at most once, so only its latest state is published
+        # and the queue never holds more entries than there are subscriptions
+        self._publish_queue: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
 
     async def open(self) -> None:
         """Open the telnet clients for communication."""
-        msg = f"Connecting to Tesira at {self._tesira.host}:{self._tesira.port}"
-        _LOGGER.info(msg)
-        if (
-            self._subscription_telnet is None
-            or self._subscription_telnet.writer is None
-            or self._subscription_telnet.writer.is_closing()
-        ):
+        _LOGGER.info(
+            "Connecting to Tesira at %s:%s", self._tesira.host, self._tesira.port
+        )
+        # Only reconnect sessions that were dropped, warm sessions are kept
+        if self._subscription_telnet is None or self._subscription_telnet.closed:
             self._subscription_telnet = await self._async_create_telnet_client(
                 "subscription_telnet"
             )
-        if (
-            self._command_telnet is None
-            or self._command_telnet.writer is None
-            or self._command_telnet.writer.is_closing()
-        ):
+        if self._command_telnet is None or self._command_telnet.closed:
             self._command_telnet = await self._async_create_telnet_client(
                 "command_telnet"
             )
+        if self._keep_alive_task is None or self._keep_alive_task.done():
+            self._keep_alive_task = asyncio.create_task(self._keep_alive())
 
         self._serial_number = await self.command("DEVICE get serialNumber")
         if not self._serial_number:
@@ -61,11 +92,12 @@ class BiampTesiraConnection:
                 f"{self._tesira.host}:{self._tesira.port}"
             )
             raise ClientConnectionError(msg)
-        msg = (
-            f"Connected to Tesira {self._serial_number} at "
-            f"{self._tesira.host}:{self._tesira.port}"
+        _LOGGER.info(
+            "Connected to Tesira %s at %s:%s",
+            self._serial_number,
+            self._tesira.host,
+            self._tesira.port,
         )
-        _LOGGER.info(msg)
 
     async def _async_create_telnet_client(
         self, identifier: str
@@ -89,8 +121,9 @@ class BiampTesiraConnection:
             await connection.readuntil(
                 "Welcome to the Tesira Text Protocol Server...\r\n", self._timeout
             )
-            msg = f"Successfully connected to {self._tesira.host}:{self._tesira.port}"
-            _LOGGER.debug(msg)
+            _LOGGER.debug(
+                "Successfully connected to %s:%s", self._tesira.host, self._tesira.port
+            )
 
         except TimeoutError as error:
             msg = f"Timeout connecting to {self._tesira.host}:{self._tesira.port}"
@@ -105,221 +138,300 @@ class BiampTesiraConnection:
     async def subscribe_all(self, subscriptions: set[Subscription]) -> None:
         """Create all of the Tesira subscriptions."""
         _LOGGER.info("Subscribing to Tesira")
-        for subscription in subscriptions:
-            await self.subscribe(subscription)
-            await asyncio.sleep(1)
+        await self._subscribe(list(subscriptions))
         _LOGGER.info("Tesira Subscriptions created successfully")
 
-    async def subscribe(self, subscription: Subscription) -> None:  # noqa: PLR0912
+    async def subscribe(self, subscription: Subscription) -> None:
         """Create a single Tesira subscription."""
+        await self._subscribe([subscription])
+
+    async def _subscribe(self, subscriptions: list[Subscription]) -> None:
+        """Send all subscribe commands at once, then handle the replies."""
         if self._subscription_telnet is None or self._subscription_telnet.closed:
             msg = "Client not connected."
             raise ClientConnectionError(msg)
 
-        _LOGGER.debug("Creating subscription for %s", subscription)
-
-        identifier = (
-            f"{subscription.instance_tag}_{subscription.attribute}_{subscription.index}"
+        # The limit queries of all new level subscriptions are in flight together
+        limits = await asyncio.gather(
+            *(self._get_level_limits(s) for s in subscriptions)
+        )
+        for subscription in subscriptions:
+            _LOGGER.debug("Creating subscription for %s", subscription)
+        replies = await self._request(
+            [
+                f"{subscription.instance_tag} subscribe {subscription.attribute} {subscription.index} {subscription.identifier}"  # noqa: E501
+                for subscription in subscriptions
+            ]
         )
-        command = f"{subscription.instance_tag} subscribe {subscription.attribute} {subscription.index} {identifier}"  # noqa: E501
-        first_response = (
-            await self._write(
-                command,
-                self._subscription_telnet,
-            )
-        ).strip()
 
-        if not first_response or first_response in ("\r\n"):
-            first_response = (
-                await self._subscription_telnet.readline(self._timeout)
-            ).strip()
+        errors = [
+            await self._handle_subscribe_reply(subscription, reply, other)
+            for subscription, reply, other in zip(
+                subscriptions, replies, limits, strict=True
+            )
+        ]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    async def _request(self, commands: list[str]) -> list[str]:
+        """Send commands on the subscription telnet and wait for their replies."""
+        if not commands:
+            return []
+        if self._subscription_telnet is None or self._subscription_telnet.closed:
+            msg = "Client not connected."
+            raise ClientConnectionError(msg)
 
-        if "-ERR ALREADY_SUBSCRIBED" in first_response:
-            return
+        loop = asyncio.get_running_loop()
+        replies = [loop.create_future() for _ in commands]
+        # Queue the futures before writing, the reader may see the replies right away
+        self._pending.extend(replies)
+        try:
+            await self._subscription_telnet.write_many(commands)
+        except ClientConnectionError as error:
+            self._fail_pending(error)
+            raise
+
+        # Replies arrive in order, so each one gets the full timeout after the
+        # previous one, however many commands were pipelined
+        for reply in replies:
+            await asyncio.wait((reply,), timeout=self._timeout)
+            if not reply.done():
+                msg = "Timeout waiting for Tesira subscription replies"
+                error = ClientTimeoutError(msg)
+                self._fail_pending(error)
+                raise error
+        return [reply.result() for reply in replies]
+
+    def _fail_pending(self, error: Exception) -> None:
+        """Fail every reply that is still pending."""
+        for reply in self._pending:
+            if not reply.done():
+                reply.set_exception(error)
+                # Retrieve the exception so that it is not reported as unhandled
+                reply.exception()
+        self._pending.clear()
+
+    async def _get_level_limits(self, subscription: Subscription) -> dict[str, float]:
+        """Return the min and max levels of a subscription, if it has any."""
+        if subscription.attribute != "level":
+            return {}
+        existing = self._subscriptions.get(subscription.identifier)
+        if existing is not None:
+            return {
+                "min_level": existing.min_level,
+                "max_level": existing.max_level,
+            }
+        return await self.get_min_max_levels(subscription)
+
+    async def _handle_subscribe_reply(
+        self, subscription: Subscription, reply: str, other_items: dict[str, float]
+    ) -> ClientResponseError | None:
+        """Create the subscription state once the Tesira confirmed it."""
+        # Interned like the keys parsed from publishToken lines, so that lookups in
+        # _subscriptions compare by identity
+        identifier = sys.intern(subscription.identifier)
+        original_value = self._initial_values.pop(identifier, None)
+
+        if "-ERR ALREADY_SUBSCRIBED" in reply:
+            return None
 
-        if "-ERR" in first_response:
-            raise ClientResponseError(first_response)
+        if reply.startswith("-"):
+            return ClientResponseError(reply)
 
         if identifier in self._subscriptions:
-            while first_response.startswith('! "publishToken":'):
-                await self.process_tesira_response(first_response)
-                first_response = (
-                    await self._subscription_telnet.readline(self._timeout)
-                ).strip()
-
-        second_response = (
-            await self._subscription_telnet.readline(self._timeout)
-        ).strip()
+            # Known subscriptions are updated by process_tesira_response
+            return None
 
-        if identifier in self._subscriptions:
-            while second_response.startswith('! "publishToken":'):
-                await self.process_tesira_response(first_response)
-                first_response = (
-                    await self._subscription_telnet.readline(self._timeout)
-                ).strip()
-
-        if second_response == "+OK":
-            original_value: str = first_response.split(" ")[2].split(":")[1]
-            other_items = {}
-
-            # Eliminate the blank line before continuing onwards
-            await self.process_tesira_response(
-                await self._subscription_telnet.readline(self._timeout)
-            )
+        if original_value is None:
+            _LOGGER.warning("No initial value received for %s", identifier)
+            return None
 
-            match subscription.attribute:
-                case "mute":
-                    variable_type = "bool"
-                case "level":
-                    variable_type = "float"
-                    other_items = await self.get_min_max_levels(subscription)
-                case _:
-                    variable_type = "str"
-
-            unique_id = f"{self._serial_number}_{subscription.instance_tag}_{subscription.attribute}_{subscription.index}"  # noqa: E501
-            data = {
-                "instance_tag": subscription.instance_tag,
-                "attribute": subscription.attribute,
-                "index": subscription.index,
-                "state": TypeAdapter(variable_type).validate_python(original_value),
-                "variable_type": variable_type,
-                "device_id": f"{self._serial_number}_{subscription.instance_tag}",
-                "unique_id": unique_id,
-                "name": subscription.name,
-                "device_name": subscription.device_name,
-                "identifier": identifier,
-                **other_items,
-            }
-            self._subscriptions[identifier] = data
-            await self._mqtt.publish_state(subscription.name, data, self._serial_number)
-        else:
-            # Eliminate the blank line before continuing onwards
-            await self.process_tesira_response(
-                await self._subscription_telnet.readline(self._timeout)
-            )
+        match subscription.attribute:
+            case "mute":
+                variable_type = "bool"
+            case "level":
+                variable_type = "float"
+            case _:
+                variable_type = "str"
+
+        state = SubscriptionState(
+            instance_tag=subscription.instance_tag,
+            attribute=subscription.attribute,
+            index=subscription.index,
+            state=_ADAPTERS[variable_type].validate_python(original_value),
+            variable_type=variable_type,
+            device_id=f"{self._serial_number}_{subscription.instance_tag}",
+            unique_id=f"{self._serial_number}_{identifier}",
+            name=subscription.name,
+            device_name=subscription.device_name,
+            identifier=identifier,
+            **other_items,
+        )
+        self._subscriptions[identifier] = state
+        await self._mqtt.publish_state(
+            subscription.name, state.as_dict(), self._serial_number
+        )
+        return None
 
     async def get_min_max_levels(self, subscription: Subscription) -> dict[str, float]:
         """Get the min and max levels of a level control block."""
-        min_level = 0.0
-        max_level = 0.0
-
-        if self._subscription_telnet is None or self._subscription_telnet.closed:
-            msg = "Client not connected."
-            raise ClientConnectionError(msg)
-
-        response = (
-            await self._write(
+        min_response, max_response = await self._request(
+            [
                 f"{subscription.instance_tag} get minLevel {subscription.index}",
-                self._subscription_telnet,
-            )
-        ).strip()
-
-        if "+OK" in response:
-            min_level = TypeAdapter(float).validate_python(
-                response.split(" ")[1].split(":")[1]
-            )
-        elif response.startswith('! "publishToken":'):
-            await self.process_tesira_response(response)
-        else:
-            raise ClientResponseError(response)
-
-        # Eliminate the blank line before continuing onwards
-        await self.process_tesira_response(
-            await self._subscription_telnet.readline(self._timeout)
-        )
-
-        response = (
-            await self._write(
                 f"{subscription.instance_tag} get maxLevel {subscription.index}",
-                self._subscription_telnet,
-            )
-        ).strip()
-
-        if "+OK" in response:
-            max_level = TypeAdapter(float).validate_python(
-                response.split(" ")[1].split(":")[1]
-            )
-        elif response.startswith('! "publishToken":'):
-            await self.process_tesira_response(response)
-        else:
-            raise ClientResponseError(response)
-
-        # Eliminate the blank line before continuing onwards
-        await self.process_tesira_response(
-            await self._subscription_telnet.readline(self._timeout)
+            ]
         )
+        return {
+            "min_level": self._parse_level(min_response),
+            "max_level": self._parse_level(max_response),
+        }
+
+    @staticmethod
+    def _parse_level(response: str) -> float:
+        """Parse the level from a +OK "value":<level> response."""
+        match = _VALUE_RE.search(response)
+        if not match:
+            raise ClientResponseError(response)
+        return _ADAPTERS["float"].validate_python(match.group(1))
 
-        return {"min_level": min_level, "max_level": max_level}
-
-    async def update_state_and_command(self, key: str, value: str) -> None:
-        """Update the state on the Tesira DSP for the specified key to the value."""
-        if not self._subscriptions.get(key):
+    async def update_state_and_command(self, key: str, payload: bytes) -> None:
+        """Update the state on the Tesira DSP for the specified key to the payload."""
+        subscription = self._subscriptions.get(key)
+        if not subscription:
             msg = f"Key: {key} does not match any subscriptions"
             raise ClientError(msg)
 
-        await self.command(
-            f"{self._subscriptions[key]['instance_tag']} set {self._subscriptions[key]['attribute']} {self._subscriptions[key]['index']} {value}"  # noqa: E501
-        )
+        # Parse the raw MQTT payload without decoding it to a str first
+        match subscription.variable_type:
+            case "bool":
+                value = _BOOL_PAYLOADS.get(payload.lower())
+            case "float":
+                try:
+                    value = float(payload)
+                except ValueError:
+                    value = None
+            case _:
+                value = payload.decode("utf-8")
+        if value is None:
+            msg = f"Invalid payload {payload!r} for {key}"
+            raise ClientError(msg)
+
+        await self.command(f"{subscription.cmd_prefix}{value}")
 
     async def command(self, command: str) -> str | None:
         """Send a command and return the response."""
-        response = (await self._write(command, self._command_telnet)).strip()
-        if "-ERR" in response:
+        async with self._command_lock:
+            try:
+                response = await self._write(command, self._command_telnet)
+            except ClientConnectionError:
+                # The session was dropped, reconnect once and replay the command
+                _LOGGER.warning("Command telnet connection lost, reconnecting")
+                if self._command_telnet is not None:
+                    self._command_telnet.close()
+                self._command_telnet = await self._async_create_telnet_client(
+                    "command_telnet"
+                )
+                response = await self._write(command, self._command_telnet)
+        response = response.strip()
+        if response.startswith("-"):
             raise ClientResponseError(response)
         if response == "+OK":
             return None
-        if "value" in response:
-            # Remove the +OK "value": from the beginning of the string and unquote it
-            return response[13:-1]
+        if match := _VALUE_RE.search(response):
+            return match.group(1)
         return response
 
-    async def listen_to_incoming_messages(self, barrier: asyncio.Barrier) -> None:
+    async def listen_to_incoming_messages(self) -> None:
         """Receive incoming messages from the Tesira and process."""
         if self._subscription_telnet is None or self._subscription_telnet.closed:
             msg = "Client not connected."
             raise ClientConnectionError(msg)
 
+        # This is the only reader of the subscription telnet, replies to commands
+        # sent on it are handed to the waiting futures by process_tesira_response
         _LOGGER.info("Starting Tesira subscription telnet reading loop")
-        await barrier.wait()
+        # Bound once, this loop runs for every line the Tesira sends. read_frame
+        # checks the connection itself and raises once it is closed
+        read_frame = self._subscription_telnet.read_frame
+        timeout = self._timeout
+        process = self.process_tesira_response
         while True:
             try:
-                response = None
-                async with self._semaphore:
-                    response = await self._subscription_telnet.readline(self._timeout)
-
-                await self.process_tesira_response(response)
+                response = await read_frame(timeout)
+                await process(response)
             except ClientTimeoutError:
                 continue
 
     async def process_tesira_response(self, response: str) -> None:
         """Process the response to a command."""
-        if not response or response in ("\r\n", "+OK"):
+        if not response:
+            return
+        if response.startswith(("+", "-")):
+            # Replies arrive in the order the commands were sent
+            if self._pending:
+                reply = self._pending.popleft()
+                if not reply.done():
+                    reply.set_result(response)
             return
-        if not response.startswith('! "publishToken":'):
+        match = _PUBLISH_RE.match(response)
+        if not match:
             return
-        tokens = response.split(" ")
-        key = tokens[1].split(":")[1][1:-1]
-        self._subscriptions[key]["state"] = TypeAdapter(
-            self._subscriptions[key]["variable_type"]
-        ).validate_python(tokens[2].split(":")[1])
+        key, value = sys.intern(match.group(1)), match.group(2)
+        subscription = self._subscriptions.get(key)
+        if subscription is None:
+            # The initial value of a subscription that is still being created
+            self._initial_values[key] = value
+            return
+        subscription.state = _CONVERTERS[subscription.variable_type](value)
+        self._queue_publish(key)
 
-        await self._mqtt.publish_state(
-            self._subscriptions[key]["name"],
-            self._subscriptions[key],
-            self._serial_number,
-        )
+    def _queue_publish(self, identifier: str) -> None:
+        """Queue the state of a subscription for the publisher task."""
+        if identifier in self._queued:
+            return
+        self._publish_queue.put_nowait(identifier)
+        self._queued.add(identifier)
+
+    async def publish_queued_states(self) -> None:
+        """Publish the state changes queued by the reader loop."""
+        _LOGGER.info("Starting Tesira state publishing loop")
+        while True:
+            identifier = await self._publish_queue.get()
+            self._queued.discard(identifier)
+            subscription = self._subscriptions[identifier]
+            await self._mqtt.publish_state(
+                subscription.name, subscription.as_dict(), self._serial_number
+            )
 
     async def automatically_subscribe_on_schedule(
-        self, barrier: asyncio.Barrier, subscriptions: set[Subscription]
+        self, startup_ready: asyncio.Event, subscriptions: set[Subscription]
     ) -> None:
         """Rerun the subscription process automatically every minute."""
         _LOGGER.info("Starting Tesira subscription setting loop")
-        await barrier.wait()
+        await startup_ready.wait()
         while True:
             await asyncio.sleep(self._tesira.resubscription_time)
             _LOGGER.debug("Resubscribing to all subscriptions")
-            async with self._semaphore:
+            try:
                 await self.subscribe_all(subscriptions)
+            except ClientError as error:
+                _LOGGER.warning("Resubscribing to Tesira failed: %s", error)
+
+    async def _keep_alive(self) -> None:
+        """Send a cheap command when the command telnet has been idle."""
+        interval = max(self._tesira.resubscription_time // 2, 1)
+        while True:
+            await asyncio.sleep(interval)
+            if (
+                self._command_telnet is not None
+                and time.monotonic() - self._command_telnet.last_activity < interval
+            ):
+                continue
+            try:
+                await self.command("DEVICE get serialNumber")
+            except ClientError as error:
+                _LOGGER.warning("Tesira keep-alive failed: %s", error)
 
     async def _write(
         self, command: str, telnet: BiampTesiraTelnetConnection | None
@@ -329,14 +441,14 @@ class BiampTesiraConnection:
             msg = "Client not connected."
             raise ClientConnectionError(msg)
         await telnet.write(command)
-        await asyncio.sleep(1)
-        response = await telnet.readline(self._timeout)
-        if command not in response:
-            return response
-        return await telnet.readline(self._timeout)
+        return await telnet.read_response(command, self._timeout)
 
     async def close(self) -> None:
         """Close all telnet connections."""
+        if self._keep_alive_task is not None:
+            self._keep_alive_task.cancel()
+            self._keep_alive_task = None
+
         if self._subscription_telnet is not None:
             try:
                 self._subscription_telnet.close()
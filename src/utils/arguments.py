@@ -3,6 +3,9 @@
 import argparse
 import os
 
+# The environment is read once, the options are all declared at startup
+_ENV: dict[str, str] = dict(os.environ)
+
 
 class EnvDefault(argparse.Action):
     """
@@ -18,8 +21,8 @@ class EnvDefault(argparse.Action):
         default: str | None = None,
         **kwargs: object,
     ) -> None:
-        if envvar and envvar in os.environ:
-            default = os.environ[envvar]
+        if envvar and (value := _ENV.get(envvar)) is not None:
+            default = value
         if required and default:
             required = False
         super().__init__(default=default, required=required, **kwargs)